@@ -7,6 +7,7 @@ from sqlalchemy import (
 )
 from sqlalchemy.engine import Engine
 from maf_utils import GDCMAF, MC3MAF
+from filter_flags import FilterRegistry, define_flag_columns, define_filter_registry_table
 
 logger = logging.getLogger(__name__)
 BATCH_SIZE = 1000
@@ -29,6 +30,7 @@ def define_db_schema(metadata, mc3_maf, gdc_maf):
     Table(
         'mc3_protected', metadata,
         *mc3_cols,
+        *define_flag_columns('mc3'),
         Index('ix_mc3_protected_tumor_barcode', 'tumor_sample_barcode'),
     )
 
@@ -47,8 +49,10 @@ def define_db_schema(metadata, mc3_maf, gdc_maf):
     Table(
         'gdc_protected', metadata,
         *gdc_cols,
+        *define_flag_columns('gdc'),
         Index('ix_gdc_protected_tumor_barcode', 'tumor_sample_barcode'),
     )
+    define_filter_registry_table(metadata)
 
 
 @event.listens_for(Engine, "connect")
@@ -60,7 +64,7 @@ def set_sqlite_pragma(dbapi_connection, connection_record):
     cursor.close()
 
 
-def load_protected_maf(conn, metadata, maf, db_table, shared_samples):
+def load_protected_maf(conn, metadata, maf, db_table, shared_samples, filter_registry, source):
     ins = db_table.insert()
     ins_batch = []
     for i, record in enumerate(maf, 1):
@@ -73,7 +77,7 @@ def load_protected_maf(conn, metadata, maf, db_table, shared_samples):
             ins_batch = []
         # Only insert records from the samples of interest
         if record.tumor_sample_barcode in shared_samples:
-            ins_batch.append(record._asdict())
+            ins_batch.append(filter_registry.add_flags(source, record._asdict()))
 
     # Load the last batch less than the batch size
     if ins_batch:
@@ -83,7 +87,8 @@ def load_protected_maf(conn, metadata, maf, db_table, shared_samples):
 def main(db_url, mc3_maf_pth, gdc_root):
     # Read all MAFs
     mc3_maf = MC3MAF(Path(mc3_maf_pth))
-    gdc_maf_pths = list(Path(gdc_root).glob('*/TCGA*.protected.maf.gz'))
+    # Load the GDC MAFs in the order of their file names, so the builds are reproducible
+    gdc_maf_pths = sorted(Path(gdc_root).glob('*/TCGA*.protected.maf.gz'), key=lambda p: p.name)
     gdc_mafs = [GDCMAF(pth) for pth in gdc_maf_pths]
 
     # Create database schema
@@ -100,6 +105,8 @@ def main(db_url, mc3_maf_pth, gdc_root):
     gdc_protected_table.drop(db_engine, checkfirst=True)
     mc3_protected_table.create(db_engine)
     gdc_protected_table.create(db_engine)
+    filter_registry_table = metadata.tables['filter_registry']
+    filter_registry_table.create(db_engine, checkfirst=True)
 
     logger.info(f'Load protected variants to {db_url}')
     conn = db_engine.connect()
@@ -113,14 +120,25 @@ def main(db_url, mc3_maf_pth, gdc_root):
     shared_samples = set(t[0] for t in r)
     logger.info(f'... only consider variants of {len(shared_samples):,d} samples')
 
+    # Share the filter bits with the public variants
+    filter_registry = FilterRegistry()
+    filter_registry.load(conn, filter_registry_table)
+
     # Load in data
     logger.info(f'Loading MC3 protected variants')
-    load_protected_maf(conn, metadata, mc3_maf, mc3_protected_table, shared_samples)
+    load_protected_maf(
+        conn, metadata, mc3_maf, mc3_protected_table, shared_samples,
+        filter_registry, 'mc3'
+    )
 
     logger.info(f'Loading GDC protected variants')
     for maf in gdc_mafs:
         logger.info(f'Loading GDC {maf.cancer_type} {maf.caller}')
-        load_protected_maf(conn, metadata, maf, gdc_protected_table, shared_samples)
+        load_protected_maf(
+            conn, metadata, maf, gdc_protected_table, shared_samples,
+            filter_registry, 'gdc'
+        )
+    filter_registry.save(conn, filter_registry_table)
 
     logger.info(f'All variants are loaded to {db_url}')
 
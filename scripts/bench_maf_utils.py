@@ -0,0 +1,233 @@
+import argparse
+from collections import namedtuple
+import logging
+import os
+from pathlib import Path
+import random
+import tempfile
+import time
+import tracemalloc
+from maf_utils import MC3MAF
+from swap_g_coord_bed import (
+    MC3MAFClean, read_line_chunks, iter_chunked_lines, swap_g_coords
+)
+
+logger = logging.getLogger(__name__)
+
+# Number of columns of the MC3 MAF
+N_COLUMNS = 114
+
+
+class NamedTupleMC3MAF(MC3MAF):
+    """MC3 MAF reader of the earlier version which builds a namedtuple per record."""
+    def make_record_class(self):
+        return namedtuple('MAFRecord', self.columns)
+
+    def __next__(self):
+        line_no, line = next(self._reader)
+        cols = line.rstrip('\n').split('\t')
+        r = self._record_cls(*cols, line_no)
+        # Rename chromosome
+        r = r._replace(chromosome=f'chr{r.chromosome}')
+        return r
+
+
+class NamedTupleMC3MAFClean(NamedTupleMC3MAF):
+    """MC3 MAF reader of the earlier swap_g_coord_bed.py without the line number."""
+    def make_columns(self, raw_columns):
+        return super().make_columns(raw_columns)[:-1]
+
+    def __next__(self):
+        line_no, line = next(self._reader)
+        cols = line.rstrip('\n').split('\t')
+        r = self._record_cls(*cols)
+        r = r._replace(chromosome=f'chr{r.chromosome}')
+        return r
+
+
+def write_mc3_maf(pth, n_records):
+    """Write a MC3-like MAF of random variants."""
+    columns = [
+        'Hugo_Symbol', 'Entrez_Gene_Id', 'Center', 'NCBI_Build',
+        'Chromosome', 'Start_Position', 'End_Position', 'Strand',
+    ]
+    columns.extend(f'Column_{i}' for i in range(len(columns), N_COLUMNS))
+    with open(str(pth), 'w') as f:
+        print(*columns, sep='\t', file=f)
+        for _ in range(n_records):
+            start = random.randint(1, 200_000_000)
+            vals = ['TP53', '7157', '.', 'GRCh37', str(random.randint(1, 22)), str(start), str(start), '+']
+            vals.extend(['ENST00000269305.4:c.817C>T'] * (N_COLUMNS - len(vals)))
+            print(*vals, sep='\t', file=f)
+
+
+def read_g_coords(pth):
+    """Read the genomic coordinates of the MAF and shift them as their converted ones."""
+    maf = MC3MAF(pth)
+    g_coords = []
+    for record in maf:
+        chrom, start, end = \
+            record.chromosome, record.start_position_int, record.end_position_int
+        g_coords.append((chrom, start, end, chrom, start + 1, end + 1))
+    maf._file.close()
+    return g_coords
+
+
+def read_coords_namedtuple(pth, g_coords, out_f):
+    """Read the genomic coordinates, like gen_g_coord_bed.py of the earlier version."""
+    maf = NamedTupleMC3MAF(pth)
+    for record in maf:
+        record.chromosome, int(record.start_position), int(record.end_position)
+    maf._file.close()
+
+
+def read_coords_record(pth, g_coords, out_f):
+    """Read the genomic coordinates, like gen_g_coord_bed.py."""
+    maf = MC3MAF(pth)
+    for record in maf:
+        record.chromosome, record.start_position_int, record.end_position_int
+    maf._file.close()
+
+
+def read_rows(maf_cls):
+    def read_rows_of_maf(pth, g_coords, out_f):
+        """Read the records as dicts, like make_db.py."""
+        maf = maf_cls(pth)
+        for record in maf:
+            record._asdict()
+        maf._file.close()
+    return read_rows_of_maf
+
+
+def swap_coords_namedtuple(pth, g_coords, out_f):
+    """Swap the coordinates record by record, like swap_g_coord_bed.py of the earlier version."""
+    maf = NamedTupleMC3MAFClean(pth)
+    for record, converted_g_coord in zip(maf, g_coords):
+        old_chrom, old_start, old_end, new_chrom, new_start, new_end = converted_g_coord
+        if old_start != int(record.start_position) or old_end != int(record.end_position):
+            raise ValueError('Record misaligned')
+        converted_record = record._replace(
+            ncbi_build='GRCh38',
+            chromosome=new_chrom,
+            start_position=new_start,
+            end_position=new_end,
+        )
+        print(*converted_record, sep='\t', file=out_f)
+    maf._file.close()
+
+
+def swap_coords_record(pth, g_coords, out_f):
+    """Swap the coordinates record by record, like the serial swap_g_coord_bed.py."""
+    maf = MC3MAFClean(pth)
+    for record, converted_g_coord in zip(maf, g_coords):
+        old_chrom, old_start, old_end, new_chrom, new_start, new_end = converted_g_coord
+        if old_start != record.start_position_int or old_end != record.end_position_int:
+            raise ValueError('Record misaligned')
+        converted_record = record._replace(
+            ncbi_build='GRCh38',
+            chromosome=new_chrom,
+            start_position=new_start,
+            end_position=new_end,
+        )
+        print(*converted_record, sep='\t', file=out_f)
+    maf._file.close()
+
+
+def swap_coords_lines(pth, g_coords, out_f):
+    """Swap the coordinates of the raw lines, like the swap stage of swap_g_coord_bed.py."""
+    maf = MC3MAFClean(pth)
+    stats = {}
+    maf_lines_with_g_coords = zip(iter_chunked_lines(read_line_chunks(maf._file)), g_coords)
+    for block in swap_g_coords(maf_lines_with_g_coords, maf.columns, stats):
+        out_f.write(block)
+    maf._file.close()
+
+
+# Name of the benchmark, the function of the earlier version, and the current one.
+# The serial swap uses the MAF records, while the pipelined swap (--out) swaps
+# the raw lines instead
+BENCHMARKS = [
+    ('coordinates', read_coords_namedtuple, read_coords_record),
+    ('dict rows', read_rows(NamedTupleMC3MAF), read_rows(MC3MAF)),
+    ('swap coordinates (serial, records)', swap_coords_namedtuple, swap_coords_record),
+    ('swap coordinates (pipelined stage, raw lines)', swap_coords_namedtuple, swap_coords_lines),
+]
+
+
+def time_bench(bench_func, pth, g_coords, n_repeats):
+    """Return the best elapsed time (in seconds) of all repeats."""
+    elapsed = []
+    with open(os.devnull, 'w') as out_f:
+        for _ in range(n_repeats):
+            start_time = time.perf_counter()
+            bench_func(pth, g_coords, out_f)
+            elapsed.append(time.perf_counter() - start_time)
+    return min(elapsed)
+
+
+def trace_bench(bench_func, pth, g_coords):
+    """Return the peak memory (in bytes) allocated by the benchmark, traced separately."""
+    with open(os.devnull, 'w') as out_f:
+        tracemalloc.start()
+        bench_func(pth, g_coords, out_f)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak
+
+
+def main(n_records, n_repeats):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pth = Path(tmp_dir) / 'mc3.maf'
+        logger.info(f'Writing {n_records:,d} records to {pth}')
+        write_mc3_maf(pth, n_records)
+        g_coords = read_g_coords(pth)
+
+        print('benchmark', 'earlier (us/record)', 'current (us/record)', 'speedup',
+              'earlier peak (KiB)', 'current peak (KiB)', sep='\t')
+        for name, earlier_func, current_func in BENCHMARKS:
+            earlier_time = time_bench(earlier_func, pth, g_coords, n_repeats)
+            current_time = time_bench(current_func, pth, g_coords, n_repeats)
+            earlier_peak = trace_bench(earlier_func, pth, g_coords)
+            current_peak = trace_bench(current_func, pth, g_coords)
+            print(
+                name,
+                f'{earlier_time / n_records * 1e6:.2f}',
+                f'{current_time / n_records * 1e6:.2f}',
+                f'{earlier_time / current_time:.2f}x',
+                f'{earlier_peak / 1024:,.0f}',
+                f'{current_peak / 1024:,.0f}',
+                sep='\t'
+            )
+
+
+def setup_cli():
+    # Setup console logging
+    console = logging.StreamHandler()
+    all_loggers = logging.getLogger()
+    all_loggers.setLevel(logging.INFO)
+    all_loggers.addHandler(console)
+    log_fmt = '[%(asctime)s][%(levelname)-7s] %(message)s'
+    log_formatter = logging.Formatter(log_fmt, '%Y-%m-%d %H:%M:%S')
+    console.setFormatter(log_formatter)
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the per-record cost of reading and swapping MAF "
+                    "records of the earlier namedtuple version and the current one.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        '--n-records', type=int, default=200000,
+        help="Number of records in the benchmark MAF"
+    )
+    parser.add_argument(
+        '--n-repeats', type=int, default=3,
+        help="Number of repeats of each benchmark"
+    )
+    return parser
+
+
+if __name__ == '__main__':
+    parser = setup_cli()
+    args = parser.parse_args()
+
+    main(args.n_records, args.n_repeats)
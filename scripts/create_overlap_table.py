@@ -31,6 +31,9 @@ FIELDS_TO_REPORT = '''\
     m.filter AS mc3_filter,
     g.filter AS gdc_filter,
     g.gdc_filter AS gdc_gdc_filter,
+    m.filter_flags AS mc3_filter_flags,
+    g.filter_flags AS gdc_filter_flags,
+    g.gdc_filter_flags AS gdc_gdc_filter_flags,
     g.mc3_overlap AS gdc_mc3_overlap,
     g.gdc_validation_status AS gdc_validation_status,
     g.t_depth_per_caller AS gdc_t_depth_per_caller,
@@ -87,6 +90,10 @@ def main(db_pth):
     ;
 
     CREATE INDEX ix_full_overlap_tumor_sample_barcode ON full_overlap (tumor_sample_barcode);
+    -- Cover the bitwise filter lookups of the samples
+    CREATE INDEX ix_full_overlap_filter_flags ON full_overlap (
+        gdc_gdc_filter_flags, gdc_filter_flags, mc3_filter_flags, tumor_sample_barcode
+    );
     '''
     # CREATE INDEX ix_full_overlap_genom_range ON full_overlap (
     #     chromosome, start_position, end_position DESC
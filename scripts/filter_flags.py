@@ -0,0 +1,113 @@
+import logging
+from sqlalchemy import Table, Column, Integer, Text, UniqueConstraint
+
+logger = logging.getLogger(__name__)
+
+# Filter columns of each source and their value separators
+FILTER_COLUMNS = {
+    'mc3': [('filter', ',')],
+    'gdc': [('filter', ';'), ('gdc_filter', ';')],
+}
+# SQLite integers are signed 64-bit
+MAX_FLAGS = 63
+
+
+def flag_column(column):
+    """Name of the bitflag column of the given filter column."""
+    return f'{column}_flags'
+
+
+def define_flag_columns(source):
+    """Define the bitflag columns of the source's filter columns."""
+    return [Column(flag_column(column), Integer()) for column, _ in FILTER_COLUMNS[source]]
+
+
+def define_filter_registry_table(metadata):
+    return Table(
+        'filter_registry', metadata,
+        Column('source', Text(), nullable=False),
+        Column('filter_column', Text(), nullable=False),
+        Column('filter_value', Text(), nullable=False),
+        Column('bit', Integer(), nullable=False),
+        UniqueConstraint('source', 'filter_column', 'filter_value'),
+    )
+
+
+class FilterRegistry:
+    """
+    Registry assigning a bit to every value of the filter columns.
+
+    A filter string such as `wga;ndp` is then stored as the bitwise OR of the
+    bits of its values. The bits are assigned per source (mc3 or gdc) and
+    filter column in the order the values are first seen, so the public and
+    protected variants of the same source share the same bits.
+    """
+    def __init__(self):
+        # Map (source, filter column) to the bits of all the filter values
+        self._bits = {}
+        # Map (source, filter column) to the flags of all the filter strings seen
+        self._flags = {}
+
+    def load(self, conn, db_table):
+        """Load the existing registry from the database."""
+        for source, column, value, bit in conn.execute(db_table.select()):
+            self._bits.setdefault((source, column), {})[value] = bit
+        self._flags.clear()
+
+    def save(self, conn, db_table):
+        """Replace the registry in the database."""
+        rows = [
+            {'source': source, 'filter_column': column, 'filter_value': value, 'bit': bit}
+            for (source, column), bits in self._bits.items()
+            for value, bit in bits.items()
+        ]
+        with conn.begin():
+            conn.execute(db_table.delete())
+            if rows:
+                conn.execute(db_table.insert(), rows)
+
+    def get_flags(self, source, column, sep, filter_str):
+        """Convert the filter string to its bitflags."""
+        key = (source, column)
+        flags_cache = self._flags.setdefault(key, {})
+        try:
+            return flags_cache[filter_str]
+        except KeyError:
+            pass
+
+        bits = self._bits.setdefault(key, {})
+        flags = 0
+        for value in (filter_str or '').split(sep):
+            if not value:
+                continue
+            if value not in bits:
+                if len(bits) >= MAX_FLAGS:
+                    raise ValueError(f'Too many filter values of {source} {column}')
+                bits[value] = len(bits)
+                logger.info(f'... register filter {source} {column} {value} as bit {bits[value]}')
+            flags |= 1 << bits[value]
+        flags_cache[filter_str] = flags
+        return flags
+
+    def add_flags(self, source, row):
+        """Add the bitflag columns to the row of the given source."""
+        for column, sep in FILTER_COLUMNS[source]:
+            row[flag_column(column)] = self.get_flags(source, column, sep, row.get(column))
+        return row
+
+
+class BitOr:
+    """
+    SQLite aggregate function computing the bitwise OR of all the values.
+
+    Like group_concat, it returns NULL if all the values are NULL.
+    """
+    def __init__(self):
+        self.value = None
+
+    def step(self, value):
+        if value is not None:
+            self.value = value if self.value is None else self.value | value
+
+    def finalize(self):
+        return self.value
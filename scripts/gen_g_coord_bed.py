@@ -1,25 +1,65 @@
 import argparse
 import gzip
+import logging
 from pathlib import Path
 from maf_utils import MC3MAF
+from liftover_cache import LiftoverCache
+
+logger = logging.getLogger(__name__)
 
 
 def main(args):
     maf_reader = MC3MAF(Path(args.maf_pth))
+    if args.cache_db is not None:
+        cache = LiftoverCache(args.cache_db, args.chain)
+        # Only write the distinct coordinates which haven't been converted
+        skipped_coords = set(cache.load())
+        cache.close()
+        logger.info(f'... skip {len(skipped_coords):,d} coordinates in the liftover cache')
+    else:
+        skipped_coords = None
+
+    n_written = 0
     with gzip.open(args.out_pth, 'wt') as f:
         for record in maf_reader:
             chrom, start, end = \
-                record.chromosome, int(record.start_position), int(record.end_position)
+                record.chromosome, record.start_position_int, record.end_position_int
+            if skipped_coords is not None:
+                if (chrom, start, end) in skipped_coords:
+                    continue
+                skipped_coords.add((chrom, start, end))
             # convert to 0-based half open interval
             start -= 1
             print(chrom, start, end, sep="\t", file=f)
+            n_written += 1
+    logger.info(f'Wrote {n_written:,d} coordinates to {args.out_pth}')
 
 
 if __name__ == '__main__':
+    # Setup console logging
+    console = logging.StreamHandler()
+    all_loggers = logging.getLogger()
+    all_loggers.setLevel(logging.INFO)
+    all_loggers.addHandler(console)
+    log_fmt = '[%(asctime)s][%(levelname)-7s] %(message)s'
+    log_formatter = logging.Formatter(log_fmt, '%Y-%m-%d %H:%M:%S')
+    console.setFormatter(log_formatter)
+
     parser = argparse.ArgumentParser(
         description="Extract genomic location from given MAF to gzip'd BED format."
     )
     parser.add_argument('maf_pth', help="Path to the MAF file")
     parser.add_argument('out_pth', help="Path to the output gzip'd BED file")
+    parser.add_argument(
+        '--cache-db',
+        help="Path to the liftover cache. If given, only the distinct coordinates "
+             "not in the cache are written."
+    )
+    parser.add_argument(
+        '--chain',
+        help="Path to the liftover chain file. Required by --cache-db."
+    )
     args = parser.parse_args()
+    if args.cache_db is not None and args.chain is None:
+        parser.error('--chain is required when --cache-db is given')
     main(args)
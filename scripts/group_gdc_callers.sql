@@ -2,6 +2,7 @@
 PRAGMA cache_size=-8000000;
 
 -- The same variant from different callers will be merged together.
+-- bit_or() is registered by scripts/run_sql.py.
 DROP TABLE IF EXISTS gdc_grouped_callers;
 CREATE TABLE IF NOT EXISTS gdc_grouped_callers AS
 SELECT
@@ -32,6 +33,7 @@ SELECT
     minimised, exac_af, exac_af_adj, exac_af_afr, exac_af_amr, exac_af_eas, exac_af_fin, exac_af_nfe, exac_af_oth, exac_af_sas,
     gene_pheno, group_concat(filter, ';') AS filter, context, src_vcf_id, tumor_bam_uuid, normal_bam_uuid, case_id,
     group_concat(gdc_filter, ';') AS gdc_filter, cosmic, mc3_overlap,
+    bit_or(filter_flags) AS filter_flags, bit_or(gdc_filter_flags) AS gdc_filter_flags,
     group_concat(gdc_validation_status, ',') AS gdc_validation_status,
     cancer_type, group_concat(caller, '|') AS callers, group_concat(raw_file_line_number, ',') AS raw_file_line_number_per_caller
 FROM gdc
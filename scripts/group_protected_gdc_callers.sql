@@ -31,6 +31,7 @@ SELECT
     motif_score_change, impact, pick, variant_class, tsl, hgvs_offset, pheno,
     minimised, exac_af, exac_af_adj, exac_af_afr, exac_af_amr, exac_af_eas, exac_af_fin, exac_af_nfe, exac_af_oth, exac_af_sas,
     gene_pheno, filter, context, src_vcf_id, tumor_bam_uuid, normal_bam_uuid, case_id, gdc_filter, cosmic, mc3_overlap, gdc_validation_status,
+    filter_flags, gdc_filter_flags,
     cancer_type, group_concat(caller, '|') AS callers, group_concat(raw_file_line_number, ',') AS raw_file_line_number_per_caller
 FROM gdc_protected
 GROUP BY
@@ -0,0 +1,90 @@
+import hashlib
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''\
+CREATE TABLE IF NOT EXISTS liftover (
+    chain_md5 TEXT NOT NULL,
+    chromosome TEXT NOT NULL,
+    start_position INTEGER NOT NULL,
+    end_position INTEGER NOT NULL,
+    new_chromosome TEXT NOT NULL,
+    new_start_position INTEGER NOT NULL,
+    new_end_position INTEGER NOT NULL,
+    PRIMARY KEY (chain_md5, chromosome, start_position, end_position)
+) WITHOUT ROWID
+'''
+
+
+def file_md5(pth):
+    """Compute the MD5 checksum of the given file."""
+    md5 = hashlib.md5()
+    with open(str(pth), 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class LiftoverCache:
+    """
+    Persistent cache of the genomic coordinate conversion results.
+
+    The results are stored in a SQLite database and keyed by the checksum of
+    the chain file and the original coordinate (1-based). A failed or split
+    conversion is stored with new chromosome '-1', the same way
+    `swap_g_coord_bed.parse_g_coord_conversion` reports it. So the cache can
+    be shared by the MAFs of different access types and by reruns.
+
+    Arguments:
+        db_pth (pathlib.Path or str): Path to the SQLite database of the cache.
+        chain_pth (pathlib.Path or str): Path to the liftover chain file.
+    """
+    def __init__(self, db_pth, chain_pth):
+        self.chain_md5 = file_md5(chain_pth)
+        self._conn = sqlite3.connect(str(db_pth), timeout=600)
+        self._conn.execute(SCHEMA)
+
+    def load(self):
+        """
+        Load all the cached conversions of the chain file.
+
+        Return a dict mapping (chrom, start, end) to the conversion result
+        (old_chrom, old_start, old_end, new_chrom, new_start, new_end).
+        """
+        cur = self._conn.execute(
+            'SELECT chromosome, start_position, end_position, '
+            'new_chromosome, new_start_position, new_end_position '
+            'FROM liftover WHERE chain_md5 = ?',
+            (self.chain_md5, )
+        )
+        return {r[:3]: r for r in cur}
+
+    def add(self, conversions):
+        """
+        Add the conversion results to the cache.
+
+        Arguments:
+            conversions: Iterable of conversion results
+                (old_chrom, old_start, old_end, new_chrom, new_start, new_end).
+
+        Return the number of conversion results read.
+        """
+        n = 0
+
+        def gen_rows():
+            nonlocal n
+            for n, conversion in enumerate(conversions, 1):
+                yield (self.chain_md5, *conversion)
+
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO liftover VALUES (?, ?, ?, ?, ?, ?, ?)',
+                gen_rows()
+            )
+        logger.info(f'Added {n:,d} coordinate conversions to the liftover cache')
+        return n
+
+    def close(self):
+        self._conn.close()
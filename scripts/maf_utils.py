@@ -1,8 +1,199 @@
-from collections import namedtuple
 from pathlib import Path
 import gzip
 
 
+class _Field:
+    """Descriptor accessing the record field at the given column index."""
+    __slots__ = ('index', )
+
+    def __init__(self, index):
+        self.index = index
+
+    def __get__(self, record, owner):
+        if record is None:
+            return self
+        return record[self.index]
+
+
+class MAFRecord:
+    """
+    Lightweight MAF record.
+
+    The record keeps the raw line and only splits it when a field is accessed,
+    up to the column of the field. So reading the first few columns, such as
+    the genomic coordinates, doesn't decode the whole line. The converted
+    values and the integer positions are computed once and cached. A line
+    with the wrong number of columns raises ValueError once it is fully split.
+
+    It is compatible with the namedtuple record of the earlier version,
+    supporting attribute access, indexing, iteration, `_fields`, `_make`,
+    `_asdict`, and `_replace`. Records constructed from the values directly
+    (like a namedtuple) store the values as is.
+
+    Use `make_record_class` to define the record class of a MAF.
+    """
+    __slots__ = ('_line', '_vals', '_complete', '_extra', '_start', '_end')
+    # Names of all the fields
+    _fields = ()
+    # Map the field name to its index
+    _index = {}
+    # Number of the fields from the MAF line, followed by the extra fields
+    _n_raw = 0
+    # Map the column index to the function converting the raw value
+    _converters = {}
+
+    def __init__(self, *vals):
+        if len(vals) != len(self._fields):
+            raise TypeError(
+                f'Expected {len(self._fields)} arguments, got {len(vals)}'
+            )
+        self._line = None
+        self._vals = list(vals)
+        self._complete = True
+        self._extra = vals[self._n_raw:]
+        self._start = None
+        self._end = None
+
+    @classmethod
+    def _from_line(cls, line, extra=()):
+        """Construct the record from the raw MAF line and values of the extra fields."""
+        record = cls.__new__(cls)
+        record._line = line
+        record._vals = None
+        record._complete = False
+        record._extra = extra
+        record._start = None
+        record._end = None
+        return record
+
+    @classmethod
+    def _make(cls, iterable):
+        return cls(*iterable)
+
+    def _split(self, i=None):
+        """
+        Split the line until the i-th column, or the whole line if i is None.
+
+        The split values are converted and stored, so the converters run once
+        per split. Once the whole line is split, the values of the extra
+        fields are appended.
+        """
+        vals = self._line.split('\t', -1 if i is None else i + 1)
+        n_vals = len(vals)
+        if i is None or n_vals <= i + 1:
+            # The whole line has been split
+            vals[-1] = vals[-1].rstrip('\n')
+            if n_vals != self._n_raw:
+                raise ValueError(
+                    f'Expected {self._n_raw} columns, got {n_vals} in MAF line '
+                    f'{self._line[:80]!r}'
+                )
+            vals.extend(self._extra)
+            self._complete = True
+        else:
+            # The last value is the rest of the line
+            n_vals -= 1
+        for j, convert in self._converters.items():
+            if j < n_vals:
+                vals[j] = convert(vals[j])
+        self._vals = vals
+        return vals
+
+    def _raw_line(self):
+        """Return the raw MAF line of the record, or None if constructed from the values."""
+        return self._line
+
+    def _values(self):
+        """Return the values of all the fields. The returned list must not be modified."""
+        if not self._complete:
+            self._split()
+        return self._vals
+
+    def __getitem__(self, i):
+        if i.__class__ is not int or i < 0:
+            return tuple(self._values())[i]
+        vals = self._vals
+        if self._complete:
+            return vals[i]
+        if i >= self._n_raw:
+            return self._extra[i - self._n_raw]
+        if vals is None or i >= len(vals) - 1:
+            vals = self._split(i)
+        return vals[i]
+
+    def __iter__(self):
+        return iter(self._values())
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __eq__(self, other):
+        if isinstance(other, (MAFRecord, tuple)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={val!r}' for name, val in zip(self._fields, self))
+        return f'{self.__class__.__name__}({fields})'
+
+    def _asdict(self):
+        return dict(zip(self._fields, self._values()))
+
+    def _replace(self, **kwargs):
+        vals = list(self._values())
+        for name, val in kwargs.items():
+            try:
+                vals[self._index[name]] = val
+            except KeyError:
+                raise ValueError(f'Got unexpected field names: {name!r}')
+        return self.__class__(*vals)
+
+    @property
+    def start_position_int(self):
+        """Start position as an integer."""
+        if self._start is None:
+            self._start = int(self.start_position)
+        return self._start
+
+    @property
+    def end_position_int(self):
+        """End position as an integer."""
+        if self._end is None:
+            self._end = int(self.end_position)
+        return self._end
+
+
+def make_record_class(name, columns, n_raw, converters=None):
+    """
+    Define a MAFRecord class of the given columns.
+
+    Arguments:
+        name (str): Name of the record class.
+        columns (list of str): Names of all the fields.
+        n_raw (int): Number of the fields from the MAF line. The rest of the
+            fields are passed as extra values.
+        converters (dict): Map the column index to the function converting
+            the raw value of the MAF line.
+    """
+    namespace = {
+        '__slots__': (),
+        '_fields': tuple(columns),
+        '_index': {c: i for i, c in enumerate(columns)},
+        '_n_raw': n_raw,
+        '_converters': converters or {},
+    }
+    for i, c in enumerate(columns):
+        namespace[c] = _Field(i)
+    return type(name, (MAFRecord, ), namespace)
+
+
+def _add_chr_prefix(chrom):
+    return f'chr{chrom}'
+
+
 class MAF:
     """
     General purpose of MAF reader.
@@ -49,9 +240,15 @@ class MAF:
         """Define the columns a variant record should store."""
         return [c.lower() for c in raw_columns]
 
+    def make_converters(self):
+        """Define the functions converting the raw values of the columns."""
+        return {}
+
     def make_record_class(self):
         """Define the record class."""
-        return namedtuple(f'MAFRecord', self.columns)
+        return make_record_class(
+            'MAFRecord', self.columns, len(self.raw_columns), self.make_converters()
+        )
 
     def make_record(self, vals):
         """Given the MAF record values from a row, construct the record"""
@@ -62,8 +259,7 @@ class MAF:
 
     def __next__(self):
         line_no, line = next(self._reader)
-        cols = line.rstrip('\n').split('\t')
-        return self.make_record(cols)
+        return self._record_cls._from_line(line)
 
 
 class MC3MAF(MAF):
@@ -85,13 +281,13 @@ class MC3MAF(MAF):
         renamed_cols.append('raw_file_line_number')
         return renamed_cols
 
+    def make_converters(self):
+        # Rename chromosome
+        return {self.columns.index('chromosome'): _add_chr_prefix}
+
     def __next__(self):
         line_no, line = next(self._reader)
-        cols = line.rstrip('\n').split('\t')
-        r = self._record_cls(*cols, line_no)
-        # Rename chromosome
-        r = r._replace(chromosome=f'chr{r.chromosome}')
-        return r
+        return self._record_cls._from_line(line, (line_no, ))
 
 
 class GDCMAF(MAF):
@@ -115,5 +311,4 @@ class GDCMAF(MAF):
 
     def __next__(self):
         line_no, line = next(self._reader)
-        cols = line.rstrip('\n').split('\t')
-        return self._record_cls(*cols, self.cancer_type, self.caller, line_no)
+        return self._record_cls._from_line(line, (self.cancer_type, self.caller, line_no))
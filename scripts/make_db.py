@@ -2,16 +2,26 @@ import argparse
 import logging
 from pathlib import Path
 from sqlalchemy import (
-    create_engine, event,
+    create_engine, event, bindparam,
     MetaData, Table, Column, Integer, Text, Index,
     UniqueConstraint
 )
 from sqlalchemy.engine import Engine
 from maf_utils import GDCMAF, MC3MAF
+from filter_flags import (
+    FilterRegistry, FILTER_COLUMNS, flag_column,
+    define_flag_columns, define_filter_registry_table
+)
 
 logger = logging.getLogger(__name__)
 BATCH_SIZE = 1000
 
+# Bits of the load order of the dual-access tables, which is made of the index
+# of the MAF pair, the public line number, and the order of the protected
+# variant calls following the same public variant call
+LOAD_ORDER_LINE_NO_BITS = 27
+LOAD_ORDER_OFFSET_BITS = 30
+
 
 def define_db_schema(metadata, mc3_maf, gdc_maf):
     mc3_cols_integer = [
@@ -30,6 +40,7 @@ def define_db_schema(metadata, mc3_maf, gdc_maf):
     Table(
         'mc3', metadata,
         *mc3_cols,
+        *define_flag_columns('mc3'),
         Index('mc3_ix_tumor_barcode', 'tumor_sample_barcode'),
         # Unique constraint
         UniqueConstraint('raw_file_line_number'),
@@ -50,10 +61,59 @@ def define_db_schema(metadata, mc3_maf, gdc_maf):
     Table(
         'gdc', metadata,
         *gdc_cols,
+        *define_flag_columns('gdc'),
         Index('gdc_ix_tumor_barcode', 'tumor_sample_barcode'),
         # Unique constraint
         UniqueConstraint('cancer_type', 'caller', 'raw_file_line_number'),
     )
+    define_filter_registry_table(metadata)
+
+
+def define_dual_access_db_schema(metadata, mc3_mafs, gdc_mafs):
+    """
+    Define the tables storing both the public and protected variants.
+
+    The columns are the union of the columns of the given MAFs, plus the
+    access_level column of each variant. The line numbers of a variant call
+    in the public and protected MAFs are stored separately. The rowid is the
+    load order of the variant call (see `dual_access_load_order`).
+    """
+    table_defs = [
+        ('mc3_all', 'mc3', mc3_mafs, ['start_position', 'end_position', 'strand_vep'], []),
+        ('gdc_all', 'gdc', gdc_mafs, ['start_position', 'end_position'], ['cancer_type', 'caller']),
+    ]
+    for table_name, source, mafs, cols_integer, file_cols in table_defs:
+        columns = []
+        for maf in mafs:
+            columns.extend(
+                c for c in maf.columns
+                if c not in columns and c != 'raw_file_line_number'
+            )
+        cols = []
+        for col in columns:
+            if col in cols_integer:
+                c = Column(col, Integer())
+            else:
+                c = Column(col, Text())
+            cols.append(c)
+        Table(
+            table_name, metadata,
+            Column('load_order', Integer(), primary_key=True, autoincrement=False),
+            *cols,
+            Column('public_raw_file_line_number', Integer()),
+            Column('protected_raw_file_line_number', Integer()),
+            *define_flag_columns(source),
+            Column('access_level', Text(), nullable=False),
+            Index(f'ix_{table_name}_tumor_barcode', 'tumor_sample_barcode'),
+            # Unique constraints of the line in each file
+            UniqueConstraint(*file_cols, 'public_raw_file_line_number'),
+            UniqueConstraint(*file_cols, 'protected_raw_file_line_number'),
+        )
+    Table(
+        'dual_access_shared_samples', metadata,
+        Column('tumor_sample_barcode', Text(), primary_key=True),
+    )
+    define_filter_registry_table(metadata)
 
 
 @event.listens_for(Engine, "connect")
@@ -65,27 +125,341 @@ def set_sqlite_pragma(dbapi_connection, connection_record):
     cursor.close()
 
 
-def load_maf(conn, metadata, maf, db_table):
+def load_maf(conn, metadata, maf, db_table, filter_registry, source):
+    rows = (filter_registry.add_flags(source, record._asdict()) for record in maf)
+    load_rows(conn, rows, db_table)
+
+
+def load_rows(conn, rows, db_table):
     ins = db_table.insert()
     ins_batch = []
-    for i, record in enumerate(maf, 1):
+    for i, row in enumerate(rows, 1):
         if i % 100000 == 0:
             logger.info(f'... inserted {i:,d} records')
         if len(ins_batch) >= BATCH_SIZE:
             with conn.begin():
                 conn.execute(ins, ins_batch)
             ins_batch = []
-        ins_batch.append(record._asdict())
+        ins_batch.append(row)
 
     # Load the last batch less than the batch size
     if ins_batch:
         conn.execute(ins, ins_batch)
 
 
+def _line_hash(line):
+    """Hash the raw MAF line, ignoring the missing newline at the end of the file."""
+    if not line.endswith('\n'):
+        line += '\n'
+    return hash(line)
+
+
+def dual_access_load_order(file_index, public_line_no, offset=0):
+    """
+    Return the load order of a variant call in the dual-access tables.
+
+    The public variant calls are ordered by their public line numbers. The
+    protected variant calls not in the public MAF follow the last public
+    variant call matched in the protected MAF. So the table lists the
+    variant calls of both the public and protected MAFs in their file order,
+    as long as the shared variant calls are in the same order in both MAFs.
+    """
+    if public_line_no >> LOAD_ORDER_LINE_NO_BITS or offset >> LOAD_ORDER_OFFSET_BITS:
+        raise ValueError(
+            f'Too many variant calls to order at public line {public_line_no} '
+            f'(protected offset {offset})'
+        )
+    return (
+        (file_index << (LOAD_ORDER_LINE_NO_BITS + LOAD_ORDER_OFFSET_BITS)) |
+        (public_line_no << LOAD_ORDER_OFFSET_BITS) |
+        offset
+    )
+
+
+def load_dual_access_public_maf(conn, maf, file_index, db_table, filter_registry, source):
+    """
+    Load the public MAF with every variant call tagged public.
+
+    Return the index of the public variant calls and the samples of the MAF.
+    The index maps the hash of the raw MAF line to its line number (or the
+    line numbers if the line is duplicated).
+    """
+    public_lines = {}
+    samples = set()
+
+    def tag_public_records():
+        for record in maf:
+            line_no = record.raw_file_line_number
+            line_hash = _line_hash(record._raw_line())
+            line_nos = public_lines.get(line_hash)
+            if line_nos is None:
+                public_lines[line_hash] = line_no
+            elif isinstance(line_nos, list):
+                line_nos.append(line_no)
+            else:
+                public_lines[line_hash] = [line_nos, line_no]
+            samples.add(record.tumor_sample_barcode)
+
+            row = filter_registry.add_flags(source, record._asdict())
+            row['public_raw_file_line_number'] = row.pop('raw_file_line_number')
+            row['protected_raw_file_line_number'] = None
+            row['load_order'] = dual_access_load_order(file_index, line_no)
+            row['access_level'] = 'public'
+            yield row
+
+    load_rows(conn, tag_public_records(), db_table)
+    return public_lines, samples
+
+
+def make_public_line_func(public_maf, protected_maf):
+    """
+    Return the function converting a raw protected MAF line to the raw public
+    MAF line of the same values, or None if the public MAF has columns which
+    are not in the protected MAF.
+    """
+    if protected_maf.raw_columns == public_maf.raw_columns:
+        return lambda line: line
+    protected_ix = {c: i for i, c in reversed(list(enumerate(protected_maf.raw_columns)))}
+    try:
+        ixs = [protected_ix[c] for c in public_maf.raw_columns]
+    except KeyError as e:
+        logger.warning(
+            f'... protected MAF has no public column {e.args[0]}. '
+            f'Load all the protected variant calls separately'
+        )
+        return None
+
+    def to_public_line(line):
+        vals = line.rstrip('\n').split('\t')
+        return '\t'.join([vals[i] for i in ixs])
+
+    return to_public_line
+
+
+def load_dual_access_protected_maf(
+    conn, protected_maf, public_maf, public_lines, file_index,
+    db_table, filter_registry, source
+):
+    """
+    Load the protected MAF and deduplicate the variant calls also in the public MAF.
+
+    The raw line of each protected variant call is looked up by its hash in
+    the index of the public variant calls. A variant call identical in both
+    MAFs (except for the line number) is already loaded, so it is only tagged
+    `both` by its load order without parsing the line further, unless the
+    protected MAF has different columns. The other protected variant
+    calls are inserted and tagged protected, and ordered after the last
+    public variant call matched.
+    """
+    to_public_line = make_public_line_func(public_maf, protected_maf)
+    extra_columns = [
+        c for c in protected_maf.columns if c not in public_maf.columns
+    ]
+    # Tag the public variant call by its load order
+    upd = db_table.update().where(db_table.c.load_order == bindparam('b_load_order')).values(
+        access_level='both',
+        protected_raw_file_line_number=bindparam('b_protected_line_no'),
+        **{c: bindparam(f'b_{c}') for c in extra_columns}
+    )
+    ins = db_table.insert()
+
+    upd_batch = []
+    ins_batch = []
+    n_both = 0
+    last_public_line_no = 0
+    offset = 0
+    for i, record in enumerate(protected_maf, 1):
+        if i % 100000 == 0:
+            logger.info(f'... loaded {i:,d} records')
+        line_nos = None
+        if to_public_line is not None:
+            line_hash = _line_hash(to_public_line(record._raw_line()))
+            line_nos = public_lines.get(line_hash)
+        if line_nos is not None:
+            if isinstance(line_nos, list):
+                public_line_no = line_nos.pop(0)
+                if not line_nos:
+                    del public_lines[line_hash]
+            else:
+                public_line_no = line_nos
+                del public_lines[line_hash]
+            last_public_line_no = public_line_no
+            offset = 0
+            params = {
+                'b_load_order': dual_access_load_order(file_index, public_line_no),
+                'b_protected_line_no': record.raw_file_line_number,
+            }
+            for c in extra_columns:
+                params[f'b_{c}'] = getattr(record, c)
+            upd_batch.append(params)
+            n_both += 1
+        else:
+            row = filter_registry.add_flags(source, record._asdict())
+            row['public_raw_file_line_number'] = None
+            row['protected_raw_file_line_number'] = row.pop('raw_file_line_number')
+            offset += 1
+            row['load_order'] = dual_access_load_order(file_index, last_public_line_no, offset)
+            row['access_level'] = 'protected'
+            ins_batch.append(row)
+
+        for stmt, batch in [(upd, upd_batch), (ins, ins_batch)]:
+            if len(batch) >= BATCH_SIZE:
+                with conn.begin():
+                    conn.execute(stmt, batch)
+                batch.clear()
+
+    # Load the last batches less than the batch size
+    for stmt, batch in [(upd, upd_batch), (ins, ins_batch)]:
+        if batch:
+            conn.execute(stmt, batch)
+    logger.info(f'... {n_both:,d} variant calls are shared with the public MAF')
+
+
+def create_access_views(conn, mc3_public_maf, gdc_public_maf, mc3_protected_maf, gdc_protected_maf):
+    """
+    Create views of the old public and protected tables.
+
+    The public variant calls are inserted in the order of the public MAFs,
+    so the public views list them in the same order without sorting. The
+    protected views expose the rowid of the underlying table, and only
+    contain the variant calls of the samples shared by MC3 and GDC.
+    """
+    view_defs = [
+        ('mc3', 'mc3_all', 'mc3', mc3_public_maf, 'public'),
+        ('gdc', 'gdc_all', 'gdc', gdc_public_maf, 'public'),
+        ('mc3_protected', 'mc3_all', 'mc3', mc3_protected_maf, 'protected'),
+        ('gdc_protected', 'gdc_all', 'gdc', gdc_protected_maf, 'protected'),
+    ]
+    for view_name, table_name, source, maf, access_level in view_defs:
+        cols = [
+            f'{access_level}_raw_file_line_number AS raw_file_line_number'
+            if c == 'raw_file_line_number' else c
+            for c in maf.columns
+        ]
+        cols.extend(flag_column(column) for column, _ in FILTER_COLUMNS[source])
+        cols = ', '.join(cols)
+        if access_level == 'protected':
+            select = f'''\
+            SELECT rowid AS rowid, {cols} FROM {table_name}
+            WHERE access_level IN ('protected', 'both')
+              AND tumor_sample_barcode IN (
+                SELECT tumor_sample_barcode FROM dual_access_shared_samples
+              )'''
+        else:
+            select = f'''\
+            SELECT {cols} FROM {table_name}
+            WHERE access_level IN ('public', 'both')'''
+        conn.execute(f'DROP VIEW IF EXISTS {view_name}')
+        conn.execute(f'CREATE VIEW {view_name} AS {select}')
+
+
+def main_dual_access(db_url, mc3_maf_pth, mc3_protected_maf_pth, gdc_root):
+    """
+    Load the public and protected MAFs of each source with the variant calls
+    shared by both MAFs deduplicated.
+
+    Each pair of the public and protected MAFs is loaded together, and every
+    file is read once. The public MAF is loaded first while its raw lines are
+    indexed. Then the protected MAF is loaded, where a variant call identical
+    to a public one is only tagged without being inserted again. Only the
+    index of the current pair is kept in memory. Once all MAFs are loaded,
+    the protected variant calls of the samples not shared by MC3 and GDC are
+    removed.
+    """
+    # Pair the public and protected GDC MAFs by their cancer type and caller
+    # in the order of make_db.py and add_protected_maf.py
+    gdc_maf_pths = {}
+    for file_type, pattern in [
+        ('somatic', '*/TCGA.*.somatic.maf.gz'),
+        ('protected', '*/TCGA*.protected.maf.gz'),
+    ]:
+        for pth in sorted(Path(gdc_root).glob(pattern), key=lambda p: p.name):
+            _, cancer_type, caller, *__ = pth.name.split('.')
+            gdc_maf_pths.setdefault((cancer_type, caller), {})[file_type] = pth
+    for (cancer_type, caller), pths in gdc_maf_pths.items():
+        if len(pths) != 2:
+            raise ValueError(f'Cannot pair the GDC MAFs of {cancer_type} by {caller}: {pths}')
+
+    # Read all MAFs
+    mc3_public_maf = MC3MAF(Path(mc3_maf_pth))
+    mc3_protected_maf = MC3MAF(Path(mc3_protected_maf_pth))
+    gdc_maf_pairs = [
+        (GDCMAF(pths['somatic']), GDCMAF(pths['protected']))
+        for pths in gdc_maf_pths.values()
+    ]
+
+    # Create database schema
+    metadata = MetaData()
+    db_engine = create_engine(db_url)
+    define_dual_access_db_schema(
+        metadata,
+        [mc3_public_maf, mc3_protected_maf],
+        [maf for maf_pair in gdc_maf_pairs for maf in maf_pair],
+    )
+    metadata.create_all(db_engine, checkfirst=True)
+
+    logger.info(f'Load variants to {db_url}')
+    conn = db_engine.connect()
+    filter_registry = FilterRegistry()
+    filter_registry.load(conn, metadata.tables['filter_registry'])
+
+    logger.info(f'Loading MC3 variants')
+    mc3_table = metadata.tables['mc3_all']
+    public_lines, mc3_samples = load_dual_access_public_maf(
+        conn, mc3_public_maf, 0, mc3_table, filter_registry, 'mc3'
+    )
+    logger.info(f'Loading MC3 protected variants')
+    load_dual_access_protected_maf(
+        conn, mc3_protected_maf, mc3_public_maf, public_lines, 0,
+        mc3_table, filter_registry, 'mc3'
+    )
+
+    logger.info(f'Loading GDC variants')
+    gdc_table = metadata.tables['gdc_all']
+    gdc_samples = set()
+    for file_index, (public_maf, protected_maf) in enumerate(gdc_maf_pairs):
+        logger.info(f'Loading GDC {public_maf.cancer_type} {public_maf.caller}')
+        public_lines, samples = load_dual_access_public_maf(
+            conn, public_maf, file_index, gdc_table, filter_registry, 'gdc'
+        )
+        gdc_samples |= samples
+        logger.info(f'Loading GDC {protected_maf.cancer_type} {protected_maf.caller} protected')
+        load_dual_access_protected_maf(
+            conn, protected_maf, public_maf, public_lines, file_index,
+            gdc_table, filter_registry, 'gdc'
+        )
+    del public_lines
+    filter_registry.save(conn, metadata.tables['filter_registry'])
+
+    # Only keep the protected variants of the samples shared by MC3 and GDC
+    shared_samples = mc3_samples & gdc_samples
+    logger.info(f'Keep protected variants of {len(shared_samples):,d} shared samples')
+    with conn.begin():
+        conn.execute(
+            metadata.tables['dual_access_shared_samples'].insert(),
+            [{'tumor_sample_barcode': s} for s in sorted(shared_samples)]
+        )
+        for table_name in ['mc3_all', 'gdc_all']:
+            r = conn.execute(f'''\
+            DELETE FROM {table_name}
+            WHERE access_level = 'protected'
+              AND tumor_sample_barcode NOT IN (
+                SELECT tumor_sample_barcode FROM dual_access_shared_samples
+              )''')
+            logger.info(f'... removed {r.rowcount:,d} protected variants from {table_name}')
+
+    create_access_views(
+        conn, mc3_public_maf, gdc_maf_pairs[0][0],
+        mc3_protected_maf, gdc_maf_pairs[0][1]
+    )
+    logger.info(f'All variants are loaded to {db_url}')
+
+
 def main(db_url, mc3_maf_pth, gdc_root):
     # Read all MAFs
     mc3_maf = MC3MAF(Path(mc3_maf_pth))
-    gdc_maf_pths = list(Path(gdc_root).glob('*/TCGA.*.somatic.maf.gz'))
+    # Load the GDC MAFs in the order of their file names, so the builds are reproducible
+    gdc_maf_pths = sorted(Path(gdc_root).glob('*/TCGA.*.somatic.maf.gz'), key=lambda p: p.name)
     gdc_mafs = [GDCMAF(pth) for pth in gdc_maf_pths]
 
     # Create database schema
@@ -98,14 +472,17 @@ def main(db_url, mc3_maf_pth, gdc_root):
     # Load in data
     logger.info(f'Load variants to {db_url}')
     conn = db_engine.connect()
+    filter_registry = FilterRegistry()
+    filter_registry.load(conn, metadata.tables['filter_registry'])
 
     logger.info(f'Loading MC3 variants')
-    load_maf(conn, metadata, mc3_maf, metadata.tables['mc3'])
+    load_maf(conn, metadata, mc3_maf, metadata.tables['mc3'], filter_registry, 'mc3')
 
     logger.info(f'Loading GDC variants')
     for maf in gdc_mafs:
         logger.info(f'Loading GDC {maf.cancer_type} {maf.caller}')
-        load_maf(conn, metadata, maf, metadata.tables['gdc'])
+        load_maf(conn, metadata, maf, metadata.tables['gdc'], filter_registry, 'gdc')
+    filter_registry.save(conn, metadata.tables['filter_registry'])
 
     logger.info(f'All variants are loaded to {db_url}')
 
@@ -136,6 +513,12 @@ def setup_cli():
         '--gdc-root', required=True,
         help='Path to the GDC data release root folder'
     )
+    parser.add_argument(
+        '--mc3-protected-maf',
+        help='Path to the hg38 version of MC3 controlled MAF. If given, load '
+             'both the public and protected MAFs with the variant calls shared '
+             'by both MAFs deduplicated'
+    )
     return parser
 
 
@@ -143,4 +526,7 @@ if __name__ == '__main__':
     parser = setup_cli()
     args = parser.parse_args()
 
-    main(args.db_url, args.mc3_maf, args.gdc_root)
+    if args.mc3_protected_maf is None:
+        main(args.db_url, args.mc3_maf, args.gdc_root)
+    else:
+        main_dual_access(args.db_url, args.mc3_maf, args.mc3_protected_maf, args.gdc_root)
@@ -0,0 +1,237 @@
+import argparse
+from collections import Counter, defaultdict
+import csv
+import gzip
+from itertools import groupby
+import logging
+from operator import itemgetter
+import sqlite3
+
+
+logger = logging.getLogger(__name__)
+
+KEY_COLUMNS = [
+    'tumor_sample_barcode', 'chromosome', 'start_position', 'end_position',
+    'reference_allele', 'tumor_seq_allele2',
+]
+
+# Variant calls of both builds are sorted by the key columns in each database.
+# Missing values are replaced by '' (text) or -1 (positions) so they sort the
+# same way in Python and can be compared.
+VARIANT_QUERY = '''\
+SELECT
+    COALESCE(fo.tumor_sample_barcode, '') AS tumor_sample_barcode,
+    COALESCE(fo.chromosome, '') AS chromosome,
+    COALESCE(fo.start_position, -1) AS start_position,
+    COALESCE(fo.end_position, -1) AS end_position,
+    COALESCE(fo.reference_allele, '') AS reference_allele,
+    COALESCE(fo.tumor_seq_allele2, '') AS tumor_seq_allele2,
+    fo.cancer_type,
+    (CASE
+        WHEN fo.shared_by_gdc_mc3 = 1 THEN 'shared'
+        WHEN fo.only_in_gdc = 1 AND gr.overlap_rowid IS NOT NULL THEN 'gdc_recoverable'
+        WHEN fo.only_in_gdc = 1 THEN 'gdc_not_recoverable'
+        WHEN fo.only_in_mc3 = 1 AND mr.overlap_rowid IS NOT NULL THEN 'mc3_recoverable'
+        WHEN fo.only_in_mc3 = 1 THEN 'mc3_not_recoverable'
+    END) AS status,
+    fo.gdc_callers,
+    fo.mc3_callers
+FROM full_overlap fo
+LEFT JOIN ({gdc_recoverable}) gr ON gr.overlap_rowid = fo.rowid
+LEFT JOIN ({mc3_recoverable}) mr ON mr.overlap_rowid = fo.rowid
+ORDER BY tumor_sample_barcode, chromosome, start_position, end_position,
+         reference_allele, tumor_seq_allele2
+'''
+
+DELTA_COLUMNS = [
+    'change', *KEY_COLUMNS, 'cancer_type',
+    'old_status', 'new_status',
+    'old_gdc_callers', 'new_gdc_callers', 'old_mc3_callers', 'new_mc3_callers',
+]
+
+
+class VariantGroup:
+    """All the variant calls of a build sharing the same key."""
+    __slots__ = ('key', 'cancer_type', 'status', 'gdc_callers', 'mc3_callers')
+
+    def __init__(self, key, rows):
+        self.key = key
+        statuses = set()
+        self.gdc_callers = set()
+        self.mc3_callers = set()
+        for row in rows:
+            self.cancer_type = row[6]
+            statuses.add(row[7])
+            if row[8]:
+                self.gdc_callers.update(row[8].split('|'))
+            if row[9]:
+                self.mc3_callers.update(row[9].split('|'))
+        self.status = '|'.join(sorted(statuses))
+
+    def callers(self):
+        """All the callers of the variant call labelled by their source."""
+        return (
+            [f'gdc:{c}' for c in self.gdc_callers] +
+            [f'mc3:{c}' for c in self.mc3_callers]
+        )
+
+
+def read_variant_groups(db_pth):
+    """
+    Stream the variant calls of the build sorted and grouped by the key columns.
+    """
+    conn = sqlite3.connect(db_pth)
+    # Both builds are read at the same time, so keep the page cache small and
+    # let SQLite sort the variant calls in temporary files
+    conn.executescript('''\
+    PRAGMA cache_size=-512000;
+    PRAGMA temp_store=FILE;
+    ''')
+    existing_tables = set(
+        t for t, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    )
+    subqueries = {}
+    for grp in ['gdc', 'mc3']:
+        table = f'{grp}_recoverable_unique'
+        if table in existing_tables:
+            subqueries[f'{grp}_recoverable'] = f'SELECT DISTINCT overlap_rowid FROM {table}'
+        else:
+            logger.warning(f'{db_pth} has no table {table}. All unique calls are not recoverable')
+            subqueries[f'{grp}_recoverable'] = 'SELECT NULL AS overlap_rowid WHERE 0'
+
+    cur = conn.execute(VARIANT_QUERY.format(**subqueries))
+    prev_key = None
+    for key, rows in groupby(cur, key=itemgetter(0, 1, 2, 3, 4, 5)):
+        if prev_key is not None and key < prev_key:
+            raise ValueError(f'Variant calls of {db_pth} are not sorted at {key}')
+        prev_key = key
+        yield VariantGroup(key, rows)
+    conn.close()
+
+
+def merge_variant_groups(old_groups, new_groups):
+    """
+    Merge the sorted variant calls of two builds by their keys.
+
+    Yield pairs of (old, new) variant groups, where either one is None if
+    the variant call only exists in one build.
+    """
+    old = next(old_groups, None)
+    new = next(new_groups, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old.key < new.key):
+            yield old, None
+            old = next(old_groups, None)
+        elif old is None or new.key < old.key:
+            yield None, new
+            new = next(new_groups, None)
+        else:
+            yield old, new
+            old = next(old_groups, None)
+            new = next(new_groups, None)
+
+
+def format_callers(group):
+    return '|'.join(sorted(group.gdc_callers)), '|'.join(sorted(group.mc3_callers))
+
+
+def main(old_db_pth, new_db_pth, out_prefix):
+    per_sample = defaultdict(Counter)
+    per_caller = defaultdict(Counter)
+    sample_cancer_types = {}
+
+    delta_pth = f'{out_prefix}.variants.tsv.gz'
+    logger.info(f'Comparing {old_db_pth} (old) to {new_db_pth} (new)')
+    with gzip.open(delta_pth, 'wt') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow(DELTA_COLUMNS)
+        merged = merge_variant_groups(
+            read_variant_groups(old_db_pth), read_variant_groups(new_db_pth)
+        )
+        for i, (old, new) in enumerate(merged, 1):
+            if i % 1000000 == 0:
+                logger.info(f'... compared {i:,d} variant calls')
+            if old is None:
+                change, group, callers = 'added', new, new.callers()
+            elif new is None:
+                change, group, callers = 'removed', old, old.callers()
+            elif old.status != new.status:
+                change, group, callers = 'changed', new, set(old.callers()) | set(new.callers())
+            else:
+                change, group, callers = 'unchanged', new, []
+
+            sample = group.key[0]
+            per_sample[sample][change] += 1
+            sample_cancer_types.setdefault(sample, group.cancer_type)
+            for caller in callers:
+                per_caller[caller][change] += 1
+            if change == 'unchanged':
+                continue
+
+            old_gdc_callers, old_mc3_callers = format_callers(old) if old else (None, None)
+            new_gdc_callers, new_mc3_callers = format_callers(new) if new else (None, None)
+            writer.writerow([
+                change, *group.key, group.cancer_type,
+                old.status if old else None, new.status if new else None,
+                old_gdc_callers, new_gdc_callers, old_mc3_callers, new_mc3_callers,
+            ])
+
+    changes = ['added', 'removed', 'changed', 'unchanged']
+    with open(f'{out_prefix}.per_sample.tsv', 'w') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow(['tumor_sample_barcode', 'cancer_type', *changes])
+        for sample in sorted(per_sample):
+            counts = per_sample[sample]
+            writer.writerow([sample, sample_cancer_types[sample], *(counts[c] for c in changes)])
+
+    with open(f'{out_prefix}.per_caller.tsv', 'w') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow(['caller', *changes[:3]])
+        for caller in sorted(per_caller):
+            counts = per_caller[caller]
+            writer.writerow([caller, *(counts[c] for c in changes[:3])])
+
+    totals = Counter()
+    for counts in per_sample.values():
+        totals.update(counts)
+    logger.info(
+        f'{totals["added"]:,d} added, {totals["removed"]:,d} removed, '
+        f'{totals["changed"]:,d} changed, {totals["unchanged"]:,d} unchanged variant calls'
+    )
+
+
+def setup_cli():
+    # Setup console logging
+    console = logging.StreamHandler()
+    all_loggers = logging.getLogger()
+    all_loggers.setLevel(logging.INFO)
+    all_loggers.addHandler(console)
+    log_fmt = '[%(asctime)s][%(levelname)-7s] %(message)s'
+    log_formatter = logging.Formatter(log_fmt, '%Y-%m-%d %H:%M:%S')
+    console.setFormatter(log_formatter)
+
+    parser = argparse.ArgumentParser(
+        description="Compare the mutation overlap of two database builds "
+                    "(e.g., two GDC data releases).",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        '--old-db-pth', required=True,
+        help="Path to the SQLite database of the old (baseline) build"
+    )
+    parser.add_argument(
+        '--new-db-pth', required=True,
+        help="Path to the SQLite database of the new build"
+    )
+    parser.add_argument(
+        '--out-prefix', required=True,
+        help="Prefix of the output files"
+    )
+    return parser
+
+
+if __name__ == '__main__':
+    parser = setup_cli()
+    args = parser.parse_args()
+
+    main(args.old_db_pth, args.new_db_pth, args.out_prefix)
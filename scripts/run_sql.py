@@ -0,0 +1,43 @@
+import argparse
+import logging
+from pathlib import Path
+import sqlite3
+from filter_flags import BitOr
+
+logger = logging.getLogger(__name__)
+
+
+def main(db_pth, sql_pths):
+    conn = sqlite3.connect(db_pth)
+    conn.create_aggregate('bit_or', 1, BitOr)
+    for sql_pth in sql_pths:
+        logger.info(f'Running {sql_pth}')
+        conn.executescript(Path(sql_pth).read_text())
+    conn.close()
+
+
+def setup_cli():
+    # Setup console logging
+    console = logging.StreamHandler()
+    all_loggers = logging.getLogger()
+    all_loggers.setLevel(logging.INFO)
+    all_loggers.addHandler(console)
+    log_fmt = '[%(asctime)s][%(levelname)-7s] %(message)s'
+    log_formatter = logging.Formatter(log_fmt, '%Y-%m-%d %H:%M:%S')
+    console.setFormatter(log_formatter)
+
+    parser = argparse.ArgumentParser(
+        description="Run SQL scripts on the SQLite database with the custom "
+                    "functions (e.g., bit_or) registered.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('db_pth', help="Path to the SQLite database")
+    parser.add_argument('sql_pths', nargs='+', help="Path to the SQL scripts")
+    return parser
+
+
+if __name__ == '__main__':
+    parser = setup_cli()
+    args = parser.parse_args()
+
+    main(args.db_pth, args.sql_pths)
@@ -1,11 +1,31 @@
 import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import gzip
 from pathlib import Path
+import queue
+import threading
+import time
+import zlib
 from maf_utils import MC3MAF
+from liftover_cache import LiftoverCache
 
 logger = logging.getLogger(__name__)
 
+# Number of bytes (approximately) each reader thread reads at a time
+READ_CHUNK_SIZE = 4 * 1024 * 1024
+# Number of bytes of converted records compressed as one gzip member
+WRITE_BLOCK_SIZE = 4 * 1024 * 1024
+# Maximal number of chunks buffered between two pipeline stages
+QUEUE_SIZE = 16
+# Number of threads of the pipeline besides the compression, which are the
+# MAF decompression and the coordinate swap. The conversion reader and the
+# writer mostly wait for the other stages
+N_PIPELINE_THREADS = 2
+
+FAILED_CONVERSION = "-1", -1, -1
+
 
 class MC3MAFClean(MC3MAF):
 
@@ -16,46 +36,88 @@ class MC3MAFClean(MC3MAF):
 
     def __next__(self):
         line_no, line = next(self._reader)
-        cols = line.rstrip('\n').split('\t')
-        r = self._record_cls(*cols)
-        # Rename chromosome
-        r = r._replace(chromosome=f'chr{r.chromosome}')
-        return r
+        return self._record_cls._from_line(line)
+
+
+def parse_g_coord_conversion(lines):
+    """
+    Parse the coordinate conversion result of crossmap line by line.
+
+    Yield the original and converted coordinates (1-based) of every input
+    record. A failed or split conversion has its converted coordinates
+    replaced by FAILED_CONVERSION.
+    """
+    lines = iter(lines)
+    line = next(lines, '')
+    while line:
+        if '(split' in line:
+            # Read until we skip all the split'd records of a same origin
+            orig_coord = tuple(line.split('\t', maxsplit=3)[:3])
+            current_coord = orig_coord
+            while '(split' in line and orig_coord == current_coord:
+                line = next(lines, '')
+                current_coord = tuple(line.split('\t', maxsplit=3)[:3])
+
+            old_chrom, old_start, old_end = orig_coord
+            yield (old_chrom, int(old_start) + 1, int(old_end), *FAILED_CONVERSION)
+            continue
+            # The while loop will break at the new record so we don't continue here
+        elif 'Fail' in line:
+            old_chrom, old_start, old_end = line.split('\t', maxsplit=3)[:3]
+            yield (old_chrom, int(old_start) + 1, int(old_end), *FAILED_CONVERSION)
+            line = next(lines, '')
+            continue
+        old_chrom, old_start, old_end, _, new_chrom, new_start, new_end = line[:-1].split('\t')
+        # Convert back to 1-based coord
+        yield old_chrom, int(old_start) + 1, int(old_end), new_chrom, int(new_start) + 1, int(new_end)
+        line = next(lines, '')
 
 
 def read_g_coord_conversion(pth):
-    FAILED_CONVERSION = "-1", -1, -1, "-1", -1, -1
     with gzip.open(pth, 'rt') as f:
-        line = f.readline()
-        while line:
-            if '(split' in line:
-                # Read until we skip all the split'd records of a same origin
-                orig_coord = tuple(line.split('\t', maxsplit=3)[:3])
-                current_coord = orig_coord
-                while '(split' in line and orig_coord == current_coord:
-                    line = f.readline()
-                    current_coord = tuple(line.split('\t', maxsplit=3)[:3])
-
-                yield FAILED_CONVERSION
-                continue
-                # The while loop will break at the new record so we don't continue here
-            elif 'Fail' in line:
-                yield FAILED_CONVERSION
-                line = f.readline()
-                continue
-            old_chrom, old_start, old_end, _, new_chrom, new_start, new_end = line[:-1].split('\t')
-            # Convert back to 1-based coord
-            yield old_chrom, int(old_start) + 1, int(old_end), new_chrom, int(new_start) + 1, int(new_end)
-            line = f.readline()
+        yield from parse_g_coord_conversion(f)
+
+
+def load_g_coord_cache(args):
+    """
+    Add the conversion result to the liftover cache and load all the cached conversions.
+    """
+    cache = LiftoverCache(args.cache_db, args.chain)
+    cache.add(read_g_coord_conversion(args.new_coord_gz_pth))
+    g_coord_lookup = cache.load()
+    cache.close()
+    logger.info(f'Loaded {len(g_coord_lookup):,d} coordinate conversions from the liftover cache')
+    return g_coord_lookup
+
+
+def lookup_g_coord(g_coord_lookup, chrom, start, end):
+    try:
+        return g_coord_lookup[(chrom, int(start), int(end))]
+    except KeyError:
+        logger.error(f'Coordinate {chrom}:{start}-{end} is not in the liftover cache')
+        raise ValueError('Missing coordinate conversion')
+
+
+def lookup_records(maf_reader, g_coord_lookup):
+    """Pair each MAF record with its converted coordinate in the liftover cache."""
+    for record in maf_reader:
+        yield record, lookup_g_coord(
+            g_coord_lookup,
+            record.chromosome, record.start_position_int, record.end_position_int
+        )
 
 
 def main(args):
     maf_reader = MC3MAFClean(Path(args.maf_pth))
-    g_coord_reader = read_g_coord_conversion(args.new_coord_gz_pth)
+    if args.cache_db is not None:
+        records = lookup_records(maf_reader, load_g_coord_cache(args))
+    else:
+        g_coord_reader = read_g_coord_conversion(args.new_coord_gz_pth)
+        records = zip(maf_reader, g_coord_reader)
     # Write the original MAF header
     print('\t'.join(maf_reader.raw_columns))
 
-    for i, (record, converted_g_coord) in enumerate(zip(maf_reader, g_coord_reader), 1):
+    for i, (record, converted_g_coord) in enumerate(records, 1):
         if i % 500000 == 0:
             logger.info(f'Read {i:,d} records')
         old_chrom, old_start, old_end, new_chrom, new_start, new_end = converted_g_coord
@@ -63,7 +125,7 @@ def main(args):
             # The conversion failed. And we SKIP THIS RECORD
             continue
         # Make sure the current record aligns to the current coordinate
-        if old_start != int(record.start_position) or old_end != int(record.end_position):
+        if old_start != record.start_position_int or old_end != record.end_position_int:
             logger.error(
                 f'Coordinate mismatch! Expected {converted_g_coord} '
                 f'but current record should be {record.chromosome}:'
@@ -81,7 +143,211 @@ def main(args):
         print(*converted_record, sep='\t')
 
 
-if __name__ == '__main__':
+class _PipelineStage(threading.Thread):
+    """
+    A pipeline stage running in its own thread.
+
+    Items yielded by the given generator function are passed to the output
+    queue. The end of the stage is marked by None, and any exception raised
+    inside the stage is passed down the queue so the consumer can re-raise it.
+    """
+    def __init__(self, name, gen_func, *args):
+        super().__init__(name=name, daemon=True)
+        self.out_queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._gen_func = gen_func
+        self._args = args
+
+    def run(self):
+        try:
+            for item in self._gen_func(*self._args):
+                self.out_queue.put(item)
+        except BaseException as e:
+            self.out_queue.put(e)
+        else:
+            self.out_queue.put(None)
+
+    def __iter__(self):
+        """Iterate over the items produced by this stage."""
+        while True:
+            item = self.out_queue.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+def read_line_chunks(f):
+    """Read lines from a text file object in chunks of approximately READ_CHUNK_SIZE bytes."""
+    chunk = f.readlines(READ_CHUNK_SIZE)
+    while chunk:
+        yield chunk
+        chunk = f.readlines(READ_CHUNK_SIZE)
+
+
+def read_gz_line_chunks(pth):
+    with gzip.open(pth, 'rt') as f:
+        yield from read_line_chunks(f)
+
+
+def iter_chunked_lines(chunks):
+    for chunk in chunks:
+        yield from chunk
+
+
+def lookup_lines(maf_lines, g_coord_lookup, columns):
+    """Pair each MAF line with its converted coordinate in the liftover cache."""
+    ix_chrom = columns.index('chromosome')
+    ix_start = columns.index('start_position')
+    ix_end = columns.index('end_position')
+    for line in maf_lines:
+        cols = line.split('\t', maxsplit=ix_end + 1)
+        yield line, lookup_g_coord(
+            g_coord_lookup,
+            f'chr{cols[ix_chrom]}', cols[ix_start], cols[ix_end]
+        )
+
+
+def swap_g_coords(maf_lines_with_g_coords, columns, stats):
+    """
+    Check the MAF records align to their converted coordinates and swap the coordinates.
+
+    Yield blocks of converted MAF records in TSV format of approximately
+    WRITE_BLOCK_SIZE bytes.
+    """
+    ix_build = columns.index('ncbi_build')
+    ix_chrom = columns.index('chromosome')
+    ix_start = columns.index('start_position')
+    ix_end = columns.index('end_position')
+    # Only split the line until the swapped columns and keep the rest as is
+    ix_max = max(ix_build, ix_chrom, ix_start, ix_end)
+
+    block = []
+    block_size = 0
+    n_read = n_skipped = 0
+    for n_read, (line, converted_g_coord) in enumerate(maf_lines_with_g_coords, 1):
+        if n_read % 500000 == 0:
+            logger.info(f'Read {n_read:,d} records')
+        old_chrom, old_start, old_end, new_chrom, new_start, new_end = converted_g_coord
+        if new_chrom == '-1':
+            # The conversion failed. And we SKIP THIS RECORD
+            n_skipped += 1
+            continue
+
+        cols = line.split('\t', ix_max + 1)
+        has_rest = len(cols) > ix_max + 1
+        if not has_rest:
+            cols[-1] = cols[-1].rstrip('\n')
+        # Make sure the current record aligns to the current coordinate
+        if old_start != int(cols[ix_start]) or old_end != int(cols[ix_end]):
+            logger.error(
+                f'Coordinate mismatch! Expected {converted_g_coord} '
+                f'but current record should be chr{cols[ix_chrom]}:'
+                f'{cols[ix_start]}-{cols[ix_end]}'
+            )
+            raise ValueError('Record misaligned')
+
+        # Replace the MAF record with the new converted coord
+        cols[ix_build] = 'GRCh38'
+        cols[ix_chrom] = new_chrom
+        cols[ix_start] = str(new_start)
+        cols[ix_end] = str(new_end)
+        # The rest of the line still ends with a newline
+        converted_line = '\t'.join(cols) if has_rest else '\t'.join(cols) + '\n'
+        block.append(converted_line)
+        block_size += len(converted_line)
+        if block_size >= WRITE_BLOCK_SIZE:
+            yield ''.join(block)
+            block = []
+            block_size = 0
+
+    stats['records_read'] = n_read
+    stats['records_skipped'] = n_skipped
+    if block:
+        yield ''.join(block)
+
+
+def gzip_compress_block(text, level):
+    """Compress the text block as a standalone gzip member."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    data = text.encode()
+    return len(data), compressor.compress(data) + compressor.flush()
+
+
+def main_pipelined(args):
+    """
+    Swap the coordinates with decompression, record alignment, and compression
+    running in separate threads.
+
+    The output is written as a multi-member gzip file, where each block of
+    records is compressed independently by a pool of threads. zlib releases
+    the GIL during (de)compression so the stages run in parallel.
+    """
+    start_time = time.perf_counter()
+    stats = {'records_read': 0, 'records_skipped': 0}
+    # The rest of the threads compress the output
+    n_compress_threads = max(1, args.threads - N_PIPELINE_THREADS)
+
+    maf_reader = MC3MAFClean(Path(args.maf_pth))
+    # The header has been consumed by the reader, so the rest of the file
+    # contains only the variant records
+    maf_stage = _PipelineStage('read_maf', read_line_chunks, maf_reader._file)
+    stages = [maf_stage]
+    if args.cache_db is not None:
+        maf_lines_with_g_coords = lookup_lines(
+            iter_chunked_lines(maf_stage), load_g_coord_cache(args), maf_reader.columns
+        )
+    else:
+        g_coord_stage = _PipelineStage('read_g_coords', read_gz_line_chunks, args.new_coord_gz_pth)
+        stages.append(g_coord_stage)
+        maf_lines_with_g_coords = zip(
+            iter_chunked_lines(maf_stage),
+            parse_g_coord_conversion(iter_chunked_lines(g_coord_stage)),
+        )
+    swap_stage = _PipelineStage(
+        'swap_g_coords', swap_g_coords,
+        maf_lines_with_g_coords, maf_reader.columns, stats,
+    )
+    stages.append(swap_stage)
+    for stage in stages:
+        stage.start()
+
+    raw_bytes = 0
+    compressed_bytes = 0
+    with open(args.out, 'wb', buffering=args.write_buffer_size) as out_f, \
+            ThreadPoolExecutor(max_workers=n_compress_threads) as executor:
+        # Write the original MAF header
+        header = '\t'.join(maf_reader.raw_columns) + '\n'
+        pending = deque([executor.submit(gzip_compress_block, header, args.compress_level)])
+        for block in swap_stage:
+            pending.append(executor.submit(gzip_compress_block, block, args.compress_level))
+            # Write the compressed blocks in order and limit the number of blocks in memory
+            while len(pending) > 2 * n_compress_threads or (pending and pending[0].done()):
+                n_raw, data = pending.popleft().result()
+                out_f.write(data)
+                raw_bytes += n_raw
+                compressed_bytes += len(data)
+        while pending:
+            n_raw, data = pending.popleft().result()
+            out_f.write(data)
+            raw_bytes += n_raw
+            compressed_bytes += len(data)
+
+    maf_reader._file.close()
+    elapsed = time.perf_counter() - start_time
+    n_written = stats['records_read'] - stats['records_skipped']
+    logger.info(
+        f'Converted {n_written:,d} records ({stats["records_skipped"]:,d} skipped) '
+        f'in {elapsed:.1f}s'
+    )
+    logger.info(
+        f'Throughput: {stats["records_read"] / elapsed:,.0f} records/s, '
+        f'{raw_bytes / elapsed / 1024 ** 2:,.1f} MiB/s uncompressed output, '
+        f'{compressed_bytes / elapsed / 1024 ** 2:,.1f} MiB/s compressed output'
+    )
+
+
+def setup_cli():
     # Setup console logging
     console = logging.StreamHandler()
     all_loggers = logging.getLogger()
@@ -92,12 +358,51 @@ if __name__ == '__main__':
     console.setFormatter(log_formatter)
 
     parser = argparse.ArgumentParser(
-        description="Swap the MAF's genomic coordinates using the given gzip'd BED format."
+        description="Swap the MAF's genomic coordinates using the given gzip'd BED format.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
     parser.add_argument('maf_pth', help="Path to the MAF file")
     parser.add_argument(
         'new_coord_gz_pth',
         help="Path to the gzip'd genomic coordinate conversion result generated by crossmap."
     )
+    parser.add_argument(
+        '--out',
+        help="Path to the gzip'd output MAF. If not given, the uncompressed MAF "
+             "is written to stdout in a single thread."
+    )
+    parser.add_argument(
+        '--threads', type=int, default=4,
+        help="Total number of threads to convert the output MAF, including "
+             f"{N_PIPELINE_THREADS} threads to read and swap the records. "
+             "The rest (at least one) compress the output"
+    )
+    parser.add_argument(
+        '--compress-level', type=int, default=6,
+        help="gzip compression level of the output MAF"
+    )
+    parser.add_argument(
+        '--write-buffer-size', type=int, default=16 * 1024 * 1024,
+        help="Size of the output file buffer in bytes"
+    )
+    parser.add_argument(
+        '--cache-db',
+        help="Path to the liftover cache. If given, the conversion result is added "
+             "to the cache, and the MAF records are converted by the cache lookup."
+    )
+    parser.add_argument(
+        '--chain',
+        help="Path to the liftover chain file. Required by --cache-db."
+    )
+    return parser
+
+
+if __name__ == '__main__':
+    parser = setup_cli()
     args = parser.parse_args()
-    main(args)
+    if args.cache_db is not None and args.chain is None:
+        parser.error('--chain is required when --cache-db is given')
+    if args.out is None:
+        main(args)
+    else:
+        main_pipelined(args)